@@ -0,0 +1,227 @@
+"""
+Statistical benchmark harness shared by the benchmarks in this repo.
+
+Each benchmark does some warmup calls, calibrates how many calls (loops) are needed for one sample
+to take at least min_sample_time, then takes repeat samples. Wall time is measured with
+perf_counter_ns, CPU time with process_time_ns, both are reported per call.
+
+Example:
+    result = benchmark(is_prime, 1_000_000_007)
+    print(result)
+    save_results([result], "results.json")
+"""
+import functools
+import json
+import math
+import platform
+import statistics
+import sys
+from time import perf_counter_ns, process_time_ns
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+
+DEFAULT_WARMUP = 3
+DEFAULT_REPEAT = 20
+# Seconds, loops per sample are doubled until one sample takes at least this long
+DEFAULT_MIN_SAMPLE_TIME = 0.01
+_MAX_LOOPS = 2**30
+
+
+class TimingStats(NamedTuple):
+    """All values are in nanoseconds per call."""
+    min: float
+    median: float
+    p95: float
+    mean: float
+    stddev: float
+
+    @classmethod
+    def from_samples(cls, samples: List[float]) -> "TimingStats":
+        ordered = sorted(samples)
+        return cls(
+            ordered[0],
+            statistics.median(ordered),
+            ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)],
+            statistics.fmean(ordered),
+            statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        )
+
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    loops: int
+    repeat: int
+    wall: TimingStats
+    cpu: TimingStats
+    return_value: Any = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        :return: JSON serializable dict, return_value is left out as it may not be serializable
+        """
+        return {
+            "name": self.name,
+            "loops": self.loops,
+            "repeat": self.repeat,
+            "wall_ns": self.wall._asdict(),
+            "cpu_ns": self.cpu._asdict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BenchmarkResult":
+        return cls(data["name"], data["loops"], data["repeat"],
+                   TimingStats(**data["wall_ns"]), TimingStats(**data["cpu_ns"]))
+
+    def __str__(self) -> str:
+        return (f"{self.name}: {format_ns(self.wall.median)} median, "
+                f"{format_ns(self.wall.min)} min, {format_ns(self.wall.p95)} p95, "
+                f"+-{format_ns(self.wall.stddev)}, {format_ns(self.cpu.median)} cpu median "
+                f"({self.repeat} x {self.loops} loops)")
+
+
+def format_ns(nanoseconds: float) -> str:
+    for unit, scale in (("s", 10**9), ("ms", 10**6), ("us", 10**3)):
+        if nanoseconds >= scale:
+            return f"{nanoseconds / scale:.3g}{unit}"
+    return f"{nanoseconds:.3g}ns"
+
+
+def _time_loops(func: Callable, args: tuple, kwargs: dict, loops: int):
+    """
+    :return: tuple of wall time ns, cpu time ns and return value of last call
+    """
+    loop_range = range(loops)
+    result = None
+    cpu_start = process_time_ns()
+    wall_start = perf_counter_ns()
+    for _ in loop_range:
+        result = func(*args, **kwargs)
+    wall_end = perf_counter_ns()
+    cpu_end = process_time_ns()
+    return wall_end - wall_start, cpu_end - cpu_start, result
+
+
+def calibrate_loops(func: Callable, *args, min_sample_time: float = DEFAULT_MIN_SAMPLE_TIME,
+                    **kwargs) -> int:
+    """
+    :return: int, smallest power of 2 amount of calls taking at least min_sample_time seconds
+    """
+    loops = 1
+    while loops < _MAX_LOOPS:
+        wall_time, _, _ = _time_loops(func, args, kwargs, loops)
+        if wall_time >= min_sample_time * 10**9:
+            break
+        loops *= 2
+    return loops
+
+
+def benchmark(func: Callable, *args, name: Optional[str] = None, warmup: int = DEFAULT_WARMUP,
+              repeat: int = DEFAULT_REPEAT, loops: Optional[int] = None,
+              min_sample_time: float = DEFAULT_MIN_SAMPLE_TIME, **kwargs) -> BenchmarkResult:
+    """
+    :param func: callable to benchmark, called as func(*args, **kwargs)
+    :param name: str, name in results, defaults to func.__qualname__
+    :param warmup: int, amount of untimed calls before calibration
+    :param repeat: int, amount of timed samples
+    :param loops: optional int, calls per sample, calibrated with min_sample_time if not passed
+    :param min_sample_time: float, seconds, minimum duration of one sample when calibrating
+    :return: BenchmarkResult, stats are per call and return_value is the value of the last call
+    """
+    if repeat < 1:
+        raise ValueError("Benchmark has to repeat at least once.")
+
+    for _ in range(warmup):
+        func(*args, **kwargs)
+    if loops is None:
+        loops = calibrate_loops(func, *args, min_sample_time=min_sample_time, **kwargs)
+
+    wall_samples = []
+    cpu_samples = []
+    result = None
+    for _ in range(repeat):
+        wall_time, cpu_time, result = _time_loops(func, args, kwargs, loops)
+        wall_samples.append(wall_time / loops)
+        cpu_samples.append(cpu_time / loops)
+
+    return BenchmarkResult(
+        name or getattr(func, "__qualname__", repr(func)), loops, repeat,
+        TimingStats.from_samples(wall_samples), TimingStats.from_samples(cpu_samples), result
+    )
+
+
+def benchmarked(**options) -> Callable:
+    """
+    Decorator version of benchmark, every call of decorated function is benchmarked with options,
+    result is printed and the function's return value is returned.
+
+    Example:
+        @benchmarked(repeat=5)
+        def example():
+            ...
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            result = benchmark(func, *args, **options, **kwargs)
+            print(result)
+            return result.return_value
+        return wrapper
+    return decorator
+
+
+def _environment() -> Dict[str, str]:
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+
+
+def save_results(results: Iterable[BenchmarkResult], path: str):
+    with open(path, "w") as f:
+        json.dump({"environment": _environment(),
+                   "results": [result.to_dict() for result in results]}, f, indent=2)
+
+
+def load_results(path: str) -> Dict[str, BenchmarkResult]:
+    """
+    :return: dict of benchmark name to result
+    """
+    with open(path) as f:
+        data = json.load(f)
+    return {result["name"]: BenchmarkResult.from_dict(result) for result in data["results"]}
+
+
+def test_benchmark() -> bool:
+    import os
+    import tempfile
+
+    calls = []
+
+    def func(x):
+        calls.append(x)
+        return x * 2
+
+    result = benchmark(func, 21, name="func", warmup=2, repeat=5, loops=3)
+    if result.return_value != 42 or len(calls) != 2 + 5 * 3 or result.loops != 3:
+        return False
+    if not result.wall.min <= result.wall.median <= result.wall.p95:
+        return False
+    if TimingStats.from_samples([float(x) for x in range(1, 101)]).p95 != 95:
+        return False
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "results.json")
+        save_results([result], path)
+        loaded = load_results(path)["func"]
+    return loaded == result._replace(return_value=None)
+
+
+if __name__ == "__main__":
+    def example():
+        for i in range(1, 1000000):
+            _ = i**0.5
+
+    print(benchmark(example, repeat=5))
+    print(benchmark(sum, range(1000), name="sum 1k"))
@@ -0,0 +1,291 @@
+"""
+Benchmark regression suite for the prime checks, the ISO 8601 parser and the member queries.
+
+Workloads are fixed (seeded) so runs on the same machine are comparable. Every benchmark runs a
+whole workload per call and is measured with benchmark.benchmark.
+DB benchmarks use a local SQLite file (benchmark_suite.sqlite3 next to this file), it is created
+on first run and reused afterwards.
+
+Usage:
+    python benchmark_suite.py run --output baseline.json
+    python benchmark_suite.py compare baseline.json --threshold 0.1
+    python benchmark_suite.py run --filter is_prime
+compare exits with status 1 when any benchmark's median is slower than baseline by more than
+threshold (fraction, 0.1 = 10%).
+"""
+import argparse
+import os
+import random
+import sys
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from benchmark import BenchmarkResult, benchmark, format_ns, load_results, save_results
+
+
+WORKLOAD_SEED = 2020
+DEFAULT_THRESHOLD = 0.1
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_suite.sqlite3")
+DB_MEMBER_COUNT = 100_000
+
+# name -> zero argument callable running the whole workload
+Workloads = Dict[str, Callable[[], object]]
+
+
+def _prime_workloads() -> Workloads:
+    from prime_numbers import is_prime
+
+    workload_random = random.Random(WORKLOAD_SEED)
+    small_numbers = range(10_000)
+    big_numbers = [workload_random.randrange(2**32, 2**64) for _ in range(1_000)]
+    workloads = {
+        "is_prime first 10k": lambda: sum(map(is_prime, small_numbers)),
+        "is_prime 1k random 64 bit": lambda: sum(map(is_prime, big_numbers)),
+    }
+
+    try:
+        from is_prime import is_prime as c_is_prime, is_prime_range
+    except ImportError:
+        # C extension isn't built (see c_extensions/prime_numbers)
+        return workloads
+
+    results = bytearray(len(small_numbers))
+    workloads.update({
+        "C is_prime first 10k": lambda: sum(map(c_is_prime, small_numbers)),
+        "C is_prime 1k random 64 bit": lambda: sum(map(c_is_prime, big_numbers)),
+        "C is_prime_range first 10k": lambda: is_prime_range(0, len(results), results),
+    })
+    return workloads
+
+
+def _timestamp_workload() -> List[str]:
+    """
+    :return: list of timestamps in the layouts parse_iso8601 supports, fast path ones
+             (YYYY-MM-DDTHH:MM:SS[.f][offset]) and ones handled by the general parser
+    """
+    workload_random = random.Random(WORKLOAD_SEED)
+    timestamps = []
+    for _ in range(1_000):
+        year = workload_random.randrange(1970, 2100)
+        month = workload_random.randrange(1, 13)
+        day = workload_random.randrange(1, 29)
+        hour, minute, second = (workload_random.randrange(limit) for limit in (24, 60, 60))
+        layout = workload_random.randrange(6)
+        if layout == 0:
+            timestamps.append(f"{year}-{month:02}-{day:02}T{hour:02}:{minute:02}:{second:02}")
+        elif layout == 1:
+            timestamps.append(f"{year}-{month:02}-{day:02}T{hour:02}:{minute:02}:{second:02}.123456Z")
+        elif layout == 2:
+            timestamps.append(f"{year}-{month:02}-{day:02}T{hour:02}:{minute:02}:{second:02}+02:00")
+        elif layout == 3:
+            timestamps.append(f"{year}{month:02}{day:02}T{hour:02}{minute:02}{second:02}Z")
+        elif layout == 4:
+            timestamps.append(f"{year}-{workload_random.randrange(1, 366):03}T{hour:02}:{minute:02}")
+        else:
+            timestamps.append(f"{year}{month:02}{day:02}T{hour:02}{minute:02}{second:02}.5-0530")
+    return timestamps
+
+
+def _parser_workloads() -> Workloads:
+    from qualifier_code_jam_6_python_discord import parse_iso8601
+
+    timestamps = _timestamp_workload()
+    return {"parse_iso8601 1k mixed": lambda: [parse_iso8601(timestamp) for timestamp in timestamps]}
+
+
+def _open_benchmark_database():
+    """
+    :return: tuned connection to DB_PATH, (re)created with DB_MEMBER_COUNT seeded members if it
+             doesn't have them
+    """
+    from db_injection_test import add_members, create_database, get_connection, random_members
+
+    if os.path.exists(DB_PATH):
+        conn = get_connection(DB_PATH, tuned=True)
+        if conn.execute("SELECT COUNT(*) FROM MEMBERS").fetchone()[0] == DB_MEMBER_COUNT:
+            return conn
+        conn.close()
+        os.remove(DB_PATH)
+
+    conn = create_database(DB_PATH, tuned=True)
+    random_state = random.getstate()
+    random.seed(WORKLOAD_SEED)
+    try:
+        add_members(random_members(DB_MEMBER_COUNT, id_length=9), conn)
+    finally:
+        random.setstate(random_state)
+    return conn
+
+
+def _db_workloads() -> Workloads:
+    from db_injection_test import (
+        get_member_data, get_members, get_members_by_email, search_members_by_phone_prefix
+    )
+
+    conn = _open_benchmark_database()
+    workload_random = random.Random(WORKLOAD_SEED)
+    members = conn.execute("SELECT MEMBER_ID,EMAIL FROM MEMBERS ORDER BY MEMBER_ID").fetchall()
+    sample = workload_random.sample(members, 1_000)
+    member_ids = [member_id for member_id, _ in sample]
+    emails = [email for _, email in sample]
+    phone_prefixes = [f"{workload_random.randrange(10**4):04}" for _ in range(1_000)]
+
+    return {
+        "get_member_data 1k": lambda: [get_member_data(member_id, conn) for member_id in member_ids],
+        "get_members 1k batched": lambda: get_members(member_ids, conn),
+        "get_members_by_email 1k": lambda: [get_members_by_email(email, conn) for email in emails],
+        "search_members_by_phone_prefix 1k": lambda: [
+            search_members_by_phone_prefix(prefix, conn, limit=10) for prefix in phone_prefixes
+        ],
+    }
+
+
+# Pairs of (group builder, names of benchmarks it can return) so groups that can't match the
+# filter aren't built (DB group creates the SQLite file). C benchmarks are only returned when
+# the extension is built.
+_WORKLOAD_GROUPS = (
+    (_prime_workloads, ("is_prime first 10k", "is_prime 1k random 64 bit", "C is_prime first 10k",
+                        "C is_prime 1k random 64 bit", "C is_prime_range first 10k")),
+    (_parser_workloads, ("parse_iso8601 1k mixed",)),
+    (_db_workloads, ("get_member_data 1k", "get_members 1k batched", "get_members_by_email 1k",
+                     "search_members_by_phone_prefix 1k")),
+)
+
+
+def _matches(name: str, name_filter: Optional[str]) -> bool:
+    return name_filter is None or name_filter in name
+
+
+def collect_workloads(name_filter: Optional[str] = None) -> Workloads:
+    """
+    :param name_filter: optional str, only groups with a benchmark whose name contains it are built
+    """
+    workloads = {}
+    for group, names in _WORKLOAD_GROUPS:
+        if any(_matches(name, name_filter) for name in names):
+            workloads.update(group())
+    return workloads
+
+
+def run_suite(name_filter: Optional[str] = None, repeat: int = 20) -> List[BenchmarkResult]:
+    """
+    :param name_filter: optional str, only benchmarks whose name contains it are run
+    :param repeat: int, samples per benchmark
+    """
+    results = []
+    for name, workload in collect_workloads(name_filter).items():
+        if not _matches(name, name_filter):
+            continue
+        result = benchmark(workload, name=name, repeat=repeat)._replace(return_value=None)
+        print(result)
+        results.append(result)
+    return results
+
+
+class Comparison(NamedTuple):
+    name: str
+    baseline_ns: float
+    current_ns: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current_ns / self.baseline_ns
+
+    def is_regression(self, threshold: float) -> bool:
+        return self.ratio > 1 + threshold
+
+
+def compare_results(baseline: Dict[str, BenchmarkResult],
+                    current: Iterable[BenchmarkResult]) -> List[Comparison]:
+    """
+    Compares wall time medians, benchmarks missing in baseline are left out.
+    """
+    return [Comparison(result.name, baseline[result.name].wall.median, result.wall.median)
+            for result in current if result.name in baseline]
+
+
+def missing_results(baseline: Dict[str, BenchmarkResult], current: Iterable[BenchmarkResult],
+                    name_filter: Optional[str] = None) -> List[str]:
+    """
+    :return: names of baseline benchmarks that didn't run (for example C extension isn't built
+             anymore), ones excluded by name_filter are not counted as missing
+    """
+    current_names = {result.name for result in current}
+    return [name for name in baseline if name not in current_names and _matches(name, name_filter)]
+
+
+def format_comparisons(comparisons: Iterable[Comparison], threshold: float) -> str:
+    lines = [f"{'benchmark':<40}{'baseline':>12}{'current':>12}{'change':>10}"]
+    for comparison in comparisons:
+        flag = "  REGRESSION" if comparison.is_regression(threshold) else ""
+        lines.append(f"{comparison.name:<40}{format_ns(comparison.baseline_ns):>12}"
+                     f"{format_ns(comparison.current_ns):>12}{comparison.ratio - 1:>+10.1%}{flag}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run suite and optionally save results")
+    run_parser.add_argument("--output", help="JSON file to save results (baseline) to")
+
+    compare_parser = subparsers.add_parser("compare", help="run suite and compare to baseline")
+    compare_parser.add_argument("baseline", help="JSON file saved with run --output")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="allowed slowdown as fraction, default %(default)s")
+    compare_parser.add_argument("--output", help="JSON file to save current results to")
+
+    for subparser in (run_parser, compare_parser):
+        subparser.add_argument("--filter", help="only run benchmarks whose name contains this")
+        subparser.add_argument("--repeat", type=int, default=20, help="samples per benchmark")
+
+    args = parser.parse_args(argv)
+    baseline = load_results(args.baseline) if args.command == "compare" else None
+    results = run_suite(args.filter, args.repeat)
+    if args.output:
+        save_results(results, args.output)
+    if baseline is None:
+        return 0
+
+    comparisons = compare_results(baseline, results)
+    print()
+    print(format_comparisons(comparisons, args.threshold))
+    regressions = [comparison for comparison in comparisons if comparison.is_regression(args.threshold)]
+    missing = missing_results(baseline, results, args.filter)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}.")
+    if missing:
+        print(f"{len(missing)} benchmark(s) from baseline didn't run: {', '.join(missing)}")
+    return 1 if regressions or missing else 0
+
+
+def test_compare_results() -> bool:
+    from benchmark import TimingStats
+
+    def result(name: str, median: float) -> BenchmarkResult:
+        stats = TimingStats(median, median, median, median, 0.0)
+        return BenchmarkResult(name, 1, 1, stats, stats)
+
+    baseline = {"fast": result("fast", 100), "slow": result("slow", 100)}
+    comparisons = compare_results(baseline, [result("fast", 105), result("slow", 150),
+                                             result("new", 10)])
+    if ([comparison.name for comparison in comparisons] != ["fast", "slow"]
+            or [comparison.is_regression(0.1) for comparison in comparisons] != [False, True]):
+        return False
+
+    current = [result("fast", 100)]
+    return (missing_results(baseline, current) == ["slow"]
+            and missing_results(baseline, current, "fast") == []
+            and missing_results(baseline, current, "slo") == ["slow"])
+
+
+def test_workload_groups() -> bool:
+    """Built groups can only return declared names, otherwise filtering could skip them."""
+    for group, names in _WORKLOAD_GROUPS[:2]:  # DB group would create the SQLite file
+        if not set(group()) <= set(names):
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(main())
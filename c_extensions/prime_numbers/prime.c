@@ -5,32 +5,283 @@ if function is called >30 times (probably due to bad dereferences).
 
 #include <Python.h>
 #include <math.h>
+#include <stdint.h>
+#include <string.h>
+
+/* Below this trial division with the wheel is faster than Miller-Rabin */
+#define TRIAL_DIVISION_LIMIT 4096
+
+/* Testing against these bases is deterministic for all n < 2^64, source: https://miller-rabin.appspot.com/ */
+static const uint64_t MILLER_RABIN_BASES[] = {2, 325, 9375, 28178, 450775, 9780504, 1795265022};
+
+/* Gaps between numbers coprime to 2*3*5 starting from 7: 7, 11, 13, 17, 19, 23, 29, 31, 37.. */
+static const unsigned char WHEEL_GAPS[] = {4, 2, 4, 2, 4, 6, 2, 6};
+
+static uint64_t mul_mod(uint64_t a, uint64_t b, uint64_t m){
+#if defined(__SIZEOF_INT128__)
+    return (uint64_t)((unsigned __int128)a * b % m);
+#else
+    /* No 128 bit type (MSVC), double and add so nothing overflows */
+    uint64_t result = 0;
+
+    a %= m;
+    while (b){
+        if (b & 1){
+            result = result >= m - a ? result - (m - a) : result + a;
+        }
+        a = a >= m - a ? a - (m - a) : a + a;
+        b >>= 1;
+    }
+    return result;
+#endif
+};
+
+static uint64_t pow_mod(uint64_t base, uint64_t exponent, uint64_t m){
+    uint64_t result = 1;
+
+    base %= m;
+    while (exponent){
+        if (exponent & 1){
+            result = mul_mod(result, base, m);
+        }
+        base = mul_mod(base, base, m);
+        exponent >>= 1;
+    }
+    return result;
+};
+
+static uint64_t isqrt(uint64_t number){
+    /* double is only precise up to 2^53, fix the estimate in both directions */
+    uint64_t root = (uint64_t)sqrt((double)number);
+
+    while (root > 0 && root > number / root){
+        root--;
+    }
+    while (root + 1 <= number / (root + 1)){
+        root++;
+    }
+    return root;
+};
+
+/*
+Strong probable prime test to passed base, number has to be odd and > 2.
+*/
+static int miller_rabin(uint64_t number, uint64_t base){
+    uint64_t d = number - 1, x;
+    int s = 0;
+
+    base %= number;
+    if (base == 0){
+        return 1;
+    }
+
+    while (!(d & 1)){
+        d >>= 1;
+        s++;
+    }
+
+    x = pow_mod(base, d, number);
+    if (x == 1 || x == number - 1){
+        return 1;
+    }
+    while (--s > 0){
+        x = mul_mod(x, x, number);
+        if (x == number - 1){
+            return 1;
+        }
+    }
+    return 0;
+};
+
+/*
+Doesn't use any Python objects so it can run without holding the GIL.
+*/
+static int check_prime(uint64_t number){
+    uint64_t i = 7, limit;
+    size_t gap = 0, base;
+
+    if (number < 7){
+        return number == 2 || number == 3 || number == 5;
+    }
+    if (number % 2 == 0 || number % 3 == 0 || number % 5 == 0){
+        return 0;
+    }
+
+    if (number < TRIAL_DIVISION_LIMIT){
+        /* Only numbers coprime to 2, 3 and 5 are tried, that's 8 out of every 30 */
+        limit = isqrt(number);
+        for (;i <= limit; i += WHEEL_GAPS[gap++ & 7]){
+            if (number % i == 0){
+                return 0;
+            }
+        }
+        return 1;
+    }
+
+    for (base = 0; base < sizeof(MILLER_RABIN_BASES) / sizeof(MILLER_RABIN_BASES[0]); base++){
+        if (!miller_rabin(number, MILLER_RABIN_BASES[base])){
+            return 0;
+        }
+    }
+    return 1;
+};
 
 static PyObject * is_prime(PyObject * self, PyObject * args){
-    int number, i = 2;
+    PyObject * number_object;
+    long long signed_number;
+    uint64_t number;
+    int overflow;
 
-    if(!PyArg_ParseTuple(args, "K", &number)){
-        Py_INCREF(Py_None);
+    if(!PyArg_ParseTuple(args, "O!", &PyLong_Type, &number_object)){
         return NULL;
     }
 
-    if (number < 2){
-        Py_INCREF(Py_False);
-        return Py_False;
+    /* Negative numbers are never primes, numbers that don't fit into 64 bits raise OverflowError */
+    signed_number = PyLong_AsLongLongAndOverflow(number_object, &overflow);
+    if (overflow == 0){
+        if (signed_number == -1 && PyErr_Occurred()){
+            return NULL;
+        }
+        number = signed_number < 0 ? 0 : (uint64_t)signed_number;
+    } else if (overflow < 0){
+        number = 0;
+    } else {
+        number = PyLong_AsUnsignedLongLong(number_object);
+        if (number == (uint64_t)-1 && PyErr_Occurred()){
+            return NULL;
+        }
     }
 
-    for (;i < sqrt(number) + 1; i++){
-        if (number % i == 0){
-            Py_INCREF(Py_False);
-            return Py_False;
-        }
+    if (check_prime(number)){
+        Py_INCREF(Py_True);
+        return Py_True;
     }
-    Py_INCREF(Py_True);
-    return Py_True;
+    Py_INCREF(Py_False);
+    return Py_False;
+};
+
+/*
+Reads element at index from buffer of any unsigned integer format (array('B'/'H'/'I'/'L'/'Q'), bytes..)
+*/
+static uint64_t buffer_item(const Py_buffer * view, Py_ssize_t index){
+    const char * item = (const char *)view->buf + index * view->itemsize;
+
+    switch (view->itemsize){
+        case 1: return *(const unsigned char *)item;
+        case 2: return *(const unsigned short *)item;
+        case 4: return *(const unsigned int *)item;
+        default: return *(const uint64_t *)item;
+    }
+};
+
+static int check_buffer_format(const Py_buffer * view){
+    /* NULL format means unsigned bytes */
+    const char * format = view->format ? view->format : "B";
+
+    if (format[0] == '@' || format[0] == '=' || format[0] == '<'){
+        format++;
+    }
+    if (format[1] != '\0' || strchr("BHILQ", format[0]) == NULL || view->itemsize > 8){
+        PyErr_Format(PyExc_TypeError, "numbers buffer has to contain unsigned integers, got format '%s'", format);
+        return 0;
+    }
+    return 1;
+};
+
+static int get_output_buffer(PyObject * out, Py_buffer * view, Py_ssize_t needed){
+    if (PyObject_GetBuffer(out, view, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS) == -1){
+        return 0;
+    }
+    if (view->len < needed){
+        PyErr_Format(PyExc_ValueError, "output buffer too small, need %zd bytes got %zd", needed, view->len);
+        PyBuffer_Release(view);
+        return 0;
+    }
+    return 1;
+};
+
+static PyObject * is_prime_buffer(PyObject * self, PyObject * args){
+    PyObject * numbers, * out;
+    Py_buffer numbers_view, out_view;
+    Py_ssize_t i, count, primes = 0;
+    unsigned char * results;
+
+    if(!PyArg_ParseTuple(args, "OO", &numbers, &out)){
+        return NULL;
+    }
+
+    if (PyObject_GetBuffer(numbers, &numbers_view, PyBUF_FORMAT | PyBUF_C_CONTIGUOUS) == -1){
+        return NULL;
+    }
+    if (!check_buffer_format(&numbers_view)){
+        PyBuffer_Release(&numbers_view);
+        return NULL;
+    }
+
+    count = numbers_view.len / numbers_view.itemsize;
+    if (!get_output_buffer(out, &out_view, count)){
+        PyBuffer_Release(&numbers_view);
+        return NULL;
+    }
+
+    results = (unsigned char *)out_view.buf;
+    Py_BEGIN_ALLOW_THREADS
+    for (i = 0; i < count; i++){
+        results[i] = (unsigned char)check_prime(buffer_item(&numbers_view, i));
+        primes += results[i];
+    }
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&out_view);
+    PyBuffer_Release(&numbers_view);
+    return PyLong_FromSsize_t(primes);
+};
+
+static PyObject * is_prime_range(PyObject * self, PyObject * args){
+    unsigned long long lo, hi;
+    uint64_t number;
+    PyObject * out;
+    Py_buffer out_view;
+    Py_ssize_t primes = 0;
+    unsigned char * results;
+
+    if(!PyArg_ParseTuple(args, "KKO", &lo, &hi, &out)){
+        return NULL;
+    }
+    if (hi < lo){
+        hi = lo;
+    }
+    if (hi - lo > (unsigned long long)PY_SSIZE_T_MAX){
+        PyErr_SetString(PyExc_OverflowError, "range is too big");
+        return NULL;
+    }
+
+    if (!get_output_buffer(out, &out_view, (Py_ssize_t)(hi - lo))){
+        return NULL;
+    }
+
+    results = (unsigned char *)out_view.buf;
+    Py_BEGIN_ALLOW_THREADS
+    for (number = lo; number < hi; number++){
+        results[number - lo] = (unsigned char)check_prime(number);
+        primes += results[number - lo];
+    }
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&out_view);
+    return PyLong_FromSsize_t(primes);
 };
 
 static PyMethodDef PrimeMethods[] = {
     {"is_prime", is_prime, METH_VARARGS, "Python3 interface for the prime C library function"},
+    {"is_prime_buffer", is_prime_buffer, METH_VARARGS,
+     "is_prime_buffer(numbers, out) -> int\n\n"
+     "Checks every number from buffer of unsigned ints (array('Q'), bytes, memoryview..) and writes\n"
+     "1 or 0 for each into writable buffer out (bytearray..). Returns number of primes found."},
+    {"is_prime_range", is_prime_range, METH_VARARGS,
+     "is_prime_range(lo, hi, out) -> int\n\n"
+     "Checks every number in range [lo, hi) and writes 1 or 0 for each into writable buffer out.\n"
+     "Returns number of primes found."},
     {NULL, NULL, 0, NULL}
 };
 
@@ -10,6 +10,44 @@ Only after you install will you be able to use it (obviously), you need Python 3
 
 if __name__ == "__main__":
     import cProfile
-    from is_prime import is_prime
+    from array import array
+    from is_prime import is_prime, is_prime_buffer, is_prime_range
     # Around 7.8s for checking first 10m numbers (i5-4590S 3GHz)
+    # Around 3.4s with wheel trial division + Miller-Rabin, most of it is now Python call overhead
     cProfile.run("for number in range(10_000_000): is_prime(number)")
+
+    # Batch calls write results to output buffer, there is no Python call per number.
+    # Around 1.6s for first 10m numbers
+    results = bytearray(10_000_000)
+    cProfile.run("is_prime_range(0, 10_000_000, results)")
+    numbers = array("Q", range(10_000_000))
+    cProfile.run("is_prime_buffer(numbers, results)")
+
+    # GIL is released during batch calls so threads can check batches side by side
+    from concurrent.futures import ThreadPoolExecutor
+    batch_size = 2_500_000
+    with ThreadPoolExecutor(4) as executor:
+        cProfile.run(
+            "list(executor.map(lambda lo: is_prime_range(lo, lo + batch_size, "
+            "memoryview(results)[lo:lo + batch_size]), range(0, 10_000_000, batch_size)))"
+        )
+
+    # Compare with pure Python implementation from the repository root on the same ranges,
+    # loaded from path since this file has the same module name.
+    import importlib.util
+    from pathlib import Path
+    from timeit import timeit
+    spec = importlib.util.spec_from_file_location(
+        "python_prime_numbers", Path(__file__).parents[2] / "prime_numbers.py"
+    )
+    python_prime_numbers = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(python_prime_numbers)
+
+    # Around 1.2s (Python) vs 0.31s (C, scalar) vs 0.17s (C, batch) for first 1m numbers
+    # Around 0.7s (Python) vs 0.05s (C, scalar) vs 0.025s (C, batch) for 100k numbers from 2^63
+    for lo, hi in ((0, 1_000_000), (2**63, 2**63 + 100_000)):
+        results = bytearray(hi - lo)
+        python_time = timeit(lambda: [python_prime_numbers.is_prime(n) for n in range(lo, hi)], number=1)
+        c_time = timeit(lambda: [is_prime(n) for n in range(lo, hi)], number=1)
+        c_batch_time = timeit(lambda: is_prime_range(lo, hi, results), number=1)
+        print(f"[{lo}, {hi}) Python: {python_time:.2f}s C: {c_time:.2f}s C batch: {c_batch_time:.2f}s")
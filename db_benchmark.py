@@ -0,0 +1,302 @@
+"""
+Benchmarks for db_injection_test MEMBERS table functions.
+Every benchmark uses a fresh database file in temporary directory.
+"""
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import tracemalloc
+from time import perf_counter
+from typing import List, Tuple
+
+from db_injection_test import (
+    ConnectionPool, MemberCache, add_members, connect, create_database, export_members,
+    get_member_data, get_member_data_async, get_members, get_members_by_email, random_members,
+    search_members_by_phone_prefix
+)
+
+
+def _percentile(samples: List[float], percentile: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * percentile))]
+
+
+def _latency_summary(samples: List[float]) -> str:
+    return (f"p50 {statistics.median(samples) * 1000:.3f}ms, "
+            f"p99 {_percentile(samples, 0.99) * 1000:.3f}ms")
+
+
+def benchmark_batched(directory: str, member_count: int = 100_000):
+    """Per row inserts (one commit each) and lookups vs batched ones."""
+    members = list(random_members(member_count, id_length=9))
+
+    conn = create_database(os.path.join(directory, "per_row.sqlite3"))
+    per_row_count = member_count // 100  # commit per row is way too slow for all of them
+    start = perf_counter()
+    for member in members[:per_row_count]:
+        # Same as add_random_member, one insert and commit per row
+        add_members((member,), conn)
+    per_row_rate = per_row_count / (perf_counter() - start)
+    conn.close()
+
+    conn = create_database(os.path.join(directory, "batched.sqlite3"))
+    start = perf_counter()
+    add_members(members, conn)
+    batched_rate = member_count / (perf_counter() - start)
+    print(f"Inserts: per row {per_row_rate:,.0f} rows/s, batched {batched_rate:,.0f} rows/s")
+
+    member_ids = [member_id for member_id, _, _ in members]
+    start = perf_counter()
+    for member_id in member_ids:
+        get_member_data(member_id, conn)
+    per_row_rate = member_count / (perf_counter() - start)
+
+    start = perf_counter()
+    get_members(member_ids, conn)
+    batched_rate = member_count / (perf_counter() - start)
+    print(f"Lookups: per row {per_row_rate:,.0f} rows/s, batched {batched_rate:,.0f} rows/s")
+    conn.close()
+
+
+def benchmark_connection_profiles(directory: str, member_count: int = 100_000,
+                                  readers: int = 4, duration: float = 5):
+    """
+    Mixed load, reader threads (each with own connection) do lookups while one writer thread
+    adds small batches of members. Default vs tuned connection profile.
+    """
+    members = list(random_members(member_count + 1_000_000, id_length=9))
+    for tuned in (False, True):
+        database_path = os.path.join(directory, f"profile_tuned_{tuned}.sqlite3")
+        conn = create_database(database_path, tuned=tuned)
+        add_members(members[:member_count], conn)
+        conn.close()
+
+        stop = threading.Event()
+        read_latencies, write_latencies = [], []
+
+        def reader():
+            reader_conn = connect(database_path, tuned=tuned)
+            latencies = []
+            while not stop.is_set():
+                member_id = random.choice(members)[0]
+                start = perf_counter()
+                get_member_data(member_id, reader_conn)
+                latencies.append(perf_counter() - start)
+            read_latencies.extend(latencies)
+            reader_conn.close()
+
+        def writer():
+            writer_conn = connect(database_path, tuned=tuned)
+            next_member = member_count
+            while not stop.is_set():
+                start = perf_counter()
+                add_members(members[next_member:next_member + 10], writer_conn)
+                write_latencies.append(perf_counter() - start)
+                next_member += 10
+            writer_conn.close()
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads.append(threading.Thread(target=writer))
+        for thread in threads:
+            thread.start()
+        stop.wait(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        profile = "tuned" if tuned else "default"
+        print(f"{profile} reads: {len(read_latencies) / duration:,.0f}/s {_latency_summary(read_latencies)}")
+        print(f"{profile} writes: {len(write_latencies) / duration:,.0f}/s {_latency_summary(write_latencies)}")
+
+
+def benchmark_pool(directory: str, member_count: int = 100_000, queries: int = 50_000,
+                   concurrency: int = 8):
+    """
+    Latency and QPS of lookups, single shared connection (guarded by lock as sqlite3 connection
+    can't be used from multiple threads at once) vs connection pool vs async front-end.
+    """
+    database_path = os.path.join(directory, "pool.sqlite3")
+    conn = create_database(database_path, tuned=True)
+    members = list(random_members(member_count, id_length=9))
+    add_members(members, conn)
+    conn.close()
+    member_ids = [random.choice(members)[0] for _ in range(queries)]
+
+    def run_threads(lookup) -> List[float]:
+        latencies = []
+
+        def worker(worker_ids):
+            worker_latencies = []
+            for member_id in worker_ids:
+                start = perf_counter()
+                lookup(member_id)
+                worker_latencies.append(perf_counter() - start)
+            latencies.extend(worker_latencies)
+
+        threads = [threading.Thread(target=worker, args=(member_ids[index::concurrency],))
+                   for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies
+
+    def report(name: str, latencies: List[float], elapsed: float):
+        print(f"{name}: {len(latencies) / elapsed:,.0f} QPS {_latency_summary(latencies)}")
+
+    shared_conn = connect(database_path, tuned=True, check_same_thread=False)
+    shared_conn_lock = threading.Lock()
+
+    def single_connection_lookup(member_id: str):
+        with shared_conn_lock:
+            return get_member_data(member_id, shared_conn)
+
+    start = perf_counter()
+    latencies = run_threads(single_connection_lookup)
+    report("Single connection", latencies, perf_counter() - start)
+    shared_conn.close()
+
+    with ConnectionPool(database_path, concurrency) as pool:
+        start = perf_counter()
+        latencies = run_threads(pool.get_member_data)
+        report("Connection pool", latencies, perf_counter() - start)
+
+        async def async_lookups() -> List[float]:
+            async_latencies = []
+            # Limit number of queries in flight, otherwise latency is mostly waiting in queue
+            in_flight = asyncio.Semaphore(concurrency * 2)
+
+            async def lookup(member_id: str):
+                async with in_flight:
+                    lookup_start = perf_counter()
+                    await get_member_data_async(member_id, pool)
+                    async_latencies.append(perf_counter() - lookup_start)
+
+            await asyncio.gather(*(lookup(member_id) for member_id in member_ids))
+            return async_latencies
+
+        start = perf_counter()
+        latencies = asyncio.run(async_lookups())
+        report("Async front-end", latencies, perf_counter() - start)
+
+
+def benchmark_member_cache(directory: str, member_count: int = 100_000, queries: int = 200_000):
+    """Skewed (Zipf) lookups with and without read-through cache."""
+    conn = create_database(os.path.join(directory, "cache.sqlite3"), tuned=True)
+    members = list(random_members(member_count, id_length=9))
+    add_members(members, conn)
+    weights = [1 / rank**1.1 for rank in range(1, member_count + 1)]
+    member_ids = [member_id for member_id, _, _ in random.choices(members, weights, k=queries)]
+
+    latencies = []
+    for member_id in member_ids:
+        start = perf_counter()
+        get_member_data(member_id, conn)
+        latencies.append(perf_counter() - start)
+    print(f"Uncached: {_latency_summary(latencies)}, mean {statistics.mean(latencies) * 1000:.4f}ms")
+
+    for ttl in (None, 1):
+        cache = MemberCache(10_000, ttl)
+        latencies = []
+        for member_id in member_ids:
+            start = perf_counter()
+            cache.get_member_data(member_id, conn)
+            latencies.append(perf_counter() - start)
+        cache_stats = cache.stats()
+        print(f"Cached (ttl {ttl}): {_latency_summary(latencies)}, "
+              f"mean {statistics.mean(latencies) * 1000:.4f}ms, "
+              f"hit rate {cache_stats.hits / (cache_stats.hits + cache_stats.misses):.1%}")
+    conn.close()
+
+
+def benchmark_indexes(directory: str, sizes: Tuple[int, ...] = (10_000, 100_000, 1_000_000),
+                      queries: int = 200):
+    """Email lookup and phone prefix search latency with indexes vs forced table scan."""
+    conn = create_database(os.path.join(directory, "indexes.sqlite3"), tuned=True)
+    members = list(random_members(sizes[-1], id_length=9))
+    inserted = 0
+    for size in sizes:
+        add_members(members[inserted:size], conn)
+        inserted = size
+        emails = [random.choice(members[:size])[1] for _ in range(queries)]
+        phone_prefixes = [random.choice(members[:size])[2][:5] for _ in range(queries)]
+
+        latencies = []
+        for email in emails:
+            start = perf_counter()
+            # Same query as get_members_by_email but NOT INDEXED forces table scan
+            conn.execute("SELECT MEMBER_ID,EMAIL,PHONE FROM MEMBERS NOT INDEXED WHERE EMAIL=?",
+                         (email,)).fetchall()
+            latencies.append(perf_counter() - start)
+        print(f"{size:,} rows, email scan: {_latency_summary(latencies)}")
+
+        for name, lookup, values in (("email indexed", get_members_by_email, emails),
+                                     ("phone prefix indexed", search_members_by_phone_prefix, phone_prefixes)):
+            latencies = []
+            for value in values:
+                start = perf_counter()
+                lookup(value, conn)
+                latencies.append(perf_counter() - start)
+            print(f"{size:,} rows, {name}: {_latency_summary(latencies)}")
+    conn.close()
+
+
+def benchmark_export(directory: str, member_count: int = 1_000_000):
+    """
+    Peak memory (Python allocations traced by tracemalloc) and rows/s of exporting the whole
+    table, fetchall + dict per row (like print_db used to do) vs streaming export.
+    """
+    conn = create_database(os.path.join(directory, "export.sqlite3"), tuned=True)
+    add_members(random_members(member_count, id_length=9), conn)
+    conn.row_factory = sqlite3.Row
+
+    def fetchall_export(out) -> int:
+        rows = conn.execute("SELECT * FROM MEMBERS").fetchall()
+        for row in rows:
+            out.write(json.dumps(dict(row)))
+            out.write("\n")
+        return len(rows)
+
+    exports = (
+        ("fetchall jsonl", fetchall_export),
+        ("streaming jsonl", lambda out: export_members(conn, out, "jsonl")),
+        ("streaming jsonl raw", lambda out: export_members(conn, out, "jsonl", raw=True)),
+        ("streaming csv", lambda out: export_members(conn, out, "csv")),
+    )
+    for name, export in exports:
+        with open(os.path.join(directory, "export.out"), "w", newline="") as out:
+            tracemalloc.start()
+            start = perf_counter()
+            rows = export(out)
+            elapsed = perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        print(f"{name}: {rows / elapsed:,.0f} rows/s, peak {peak / 2**20:.1f}MB")
+    conn.close()
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as temp_directory:
+        # Around 3k rows/s per row vs 480k rows/s batched inserts,
+        # around 150k rows/s per row vs 340k rows/s batched lookups
+        benchmark_batched(temp_directory)
+        # Default: around 8k reads/s (p99 0.03ms), 1.1k writes/s (p50 0.7ms, p99 4ms)
+        # Tuned: around 85k reads/s (p99 0.02ms), 1k writes/s (p50 0.1ms, p99 25ms on checkpoints)
+        benchmark_connection_profiles(temp_directory)
+        # On a single core machine around 75k QPS (p99 0.02ms) single connection, 55k QPS
+        # (p99 0.04ms) pool and 11k QPS (p50 0.9ms, p99 2ms) async (executor hand-off dominates).
+        # Only the pool can scale with cores since sqlite releases the GIL while querying.
+        benchmark_pool(temp_directory)
+        # Around 0.009ms mean uncached vs 0.004ms cached (p50 0.001ms, ~83% hit rate)
+        benchmark_member_cache(temp_directory)
+        # Email scan grows with table, around 0.7ms (10k), 8ms (100k), 80ms (1m rows) p50,
+        # indexed lookups stay around 0.01ms and prefix search 0.01-0.04ms
+        benchmark_indexes(temp_directory)
+        # 1m rows, around 18k rows/s and 276MB peak fetchall jsonl vs 18k (jsonl), 26k (jsonl raw),
+        # 76k (csv) rows/s and under 1MB peak streaming
+        benchmark_export(temp_directory)
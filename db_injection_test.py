@@ -1,11 +1,62 @@
+import asyncio
+import csv
+import json
+import queue
 import random
 import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
 from string import digits, ascii_uppercase
+from typing import Dict, Generator, Iterable, Iterator, NamedTuple, Optional, TextIO, Tuple, Union
 
 
-def create_database(database_path: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(database_path)
+# SQLite by default allows max 999 placeholders in one query
+_MAX_QUERY_PARAMETERS = 999
+
+# Pragmas set on connections opened with tuned=True. WAL lets readers and the writer work at the
+# same time and with synchronous NORMAL commits don't wait for fsync (still safe in WAL mode,
+# only last transactions can be lost on power loss).
+TUNED_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -65536,  # negative value is in KiB, so 64MB
+    "mmap_size": 256 * 2**20,
+    "temp_store": "MEMORY",
+}
+# Index name -> indexed column, for lookups by email/phone (see ensure_indexes)
+_SECONDARY_INDEXES = {
+    "MEMBERS_EMAIL_INDEX": "EMAIL",
+    "MEMBERS_PHONE_INDEX": "PHONE",
+}
+# Number of prepared statements kept per connection (sqlite3 default is 128)
+TUNED_CACHED_STATEMENTS = 512
+
+
+def connect(database_path: str, *, tuned: bool = False, **kwargs) -> sqlite3.Connection:
+    """
+    Connection factory, all connections in this module are opened with it.
+    :param tuned: bool, default False. If True TUNED_PRAGMAS are applied and statement cache is
+                  sized to TUNED_CACHED_STATEMENTS.
+    :param kwargs: passed to sqlite3.connect
+    """
+    if tuned:
+        kwargs.setdefault("cached_statements", TUNED_CACHED_STATEMENTS)
+
+    conn = sqlite3.connect(database_path, **kwargs)
+    if tuned:
+        for pragma, value in TUNED_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma}={value}")
+    return conn
+
+
+def create_database(database_path: str, *, tuned: bool = False) -> sqlite3.Connection:
+    conn = connect(database_path, tuned=tuned)
     conn.execute(
         """
         CREATE TABLE MEMBERS (
@@ -15,37 +66,83 @@ def create_database(database_path: str) -> sqlite3.Connection:
         )
         """
     )
+    ensure_indexes(conn)
 
-    for _ in range(3):
-        add_random_member(conn)
-
-    conn.commit()
+    add_members(random_members(3), conn)
     return conn
 
 
-def get_connection(database_path: str) -> sqlite3.Connection:
+def ensure_indexes(conn: sqlite3.Connection):
+    """
+    Creates secondary indexes on MEMBERS table if they don't exist yet,
+    so databases created before indexes were added are migrated on connect.
+    """
+    with conn:
+        for index_name, column in _SECONDARY_INDEXES.items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON MEMBERS({column})")
+
+
+def get_connection(database_path: str, *, tuned: bool = False) -> sqlite3.Connection:
     """
     Returns connection to the database.
     If database file is not found then it creates database.
+    :param tuned: bool, default False. See connect.
     """
     if Path(database_path).is_file():
-        conn = sqlite3.connect(database_path)
+        conn = connect(database_path, tuned=tuned)
+        ensure_indexes(conn)
         return conn
     else:
         print("Database not found! Creating fresh ...")
-        return create_database(database_path)
+        return create_database(database_path, tuned=tuned)
+
+
+def random_members(count: Optional[int] = None, id_length: int = 4) -> Generator[Tuple[str, str, str], None, None]:
+    """
+    Generates random members with random int values, IDs are unique within one generator.
+    :param count: int, number of members to generate. None for infinite generator.
+    :param id_length: int, number of digits in member ID, has to be big enough for count
+    :return: generator yielding tuples of member ID, email and phone
+    """
+    generated_ids = set()
+    while count is None or len(generated_ids) < count:
+        random_id = "".join(random.choices(digits, k=id_length))
+        if random_id in generated_ids:
+            continue
+        generated_ids.add(random_id)
+
+        random_email = "".join(random.choices(ascii_uppercase, k=5))
+        random_phone = "".join(random.choices(digits, k=8))
+        yield random_id, random_email, random_phone
 
 
-def add_random_member(conn: sqlite3.Connection):
+def add_random_member(conn: sqlite3.Connection, cache: Optional["MemberCache"] = None):
     """
     Adds random member with random int values to table MEMBERS
+    :param cache: optional MemberCache, added member is invalidated in it
     """
+    add_members(random_members(1), conn, cache)
+
+
+def add_members(rows: Iterable[Tuple[str, str, str]], conn: sqlite3.Connection,
+                cache: Optional["MemberCache"] = None) -> int:
+    """
+    Adds all members to table MEMBERS in a single transaction (one commit for all rows).
+    If any insert fails nothing is added.
+    :param rows: iterable of tuples of member ID, email and phone
+    :param cache: optional MemberCache, added members are invalidated in it after commit
+    :return: int, number of added members
+    """
+    if cache is not None:
+        rows = list(rows)
+
     query = "INSERT INTO MEMBERS VALUES(?,?,?)"
-    random_id = "".join(random.choices(digits, k=4))
-    random_email = "".join(random.choices(ascii_uppercase, k=5))
-    random_phone = "".join(random.choices(digits, k=8))
-    conn.execute(query, (random_id, random_email, random_phone))
-    conn.commit()
+    with conn:
+        cursor = conn.executemany(query, rows)
+
+    if cache is not None:
+        cache.invalidate(member_id for member_id, _, _ in rows)
+    return cursor.rowcount
 
 
 def get_member_data(member_id: str, conn: sqlite3.Connection) -> dict:
@@ -61,6 +158,85 @@ def get_member_data(member_id: str, conn: sqlite3.Connection) -> dict:
     return dict(rows)
 
 
+def get_members(member_ids: Iterable[str], conn: sqlite3.Connection) -> Dict[str, Tuple[str, str]]:
+    """
+    Gets email and phone data for many members, many IDs are fetched with a single query.
+    This function uses placeholders in query so it is injection safe.
+    :return: dict where keys are member IDs and values are tuples of email and phone.
+             IDs that are not found are not in dict.
+    """
+    members = {}
+    member_ids = iter(member_ids)
+    while True:
+        chunk = tuple(islice(member_ids, _MAX_QUERY_PARAMETERS))
+        if not chunk:
+            return members
+
+        placeholders = ",".join("?" * len(chunk))
+        query = f"SELECT MEMBER_ID,EMAIL,PHONE FROM MEMBERS WHERE MEMBER_ID IN ({placeholders})"
+        for member_id, email, phone in conn.execute(query, chunk):
+            members[member_id] = (email, phone)
+
+
+def get_members_by_email(email: str, conn: sqlite3.Connection) -> Dict[str, Tuple[str, str]]:
+    """
+    Reverse lookup, uses MEMBERS_EMAIL_INDEX.
+    :return: dict where keys are member IDs and values are tuples of email and phone
+    """
+    return _get_members_by_column("EMAIL", email, conn)
+
+
+def get_members_by_phone(phone: str, conn: sqlite3.Connection) -> Dict[str, Tuple[str, str]]:
+    """
+    Reverse lookup, uses MEMBERS_PHONE_INDEX.
+    :return: dict where keys are member IDs and values are tuples of email and phone
+    """
+    return _get_members_by_column("PHONE", phone, conn)
+
+
+def search_members_by_email_prefix(prefix: str, conn: sqlite3.Connection,
+                                   limit: int = 100) -> Dict[str, Tuple[str, str]]:
+    """
+    :return: dict of at most limit members whose email starts with prefix, ordered by email
+    """
+    return _search_members_by_prefix("EMAIL", prefix, conn, limit)
+
+
+def search_members_by_phone_prefix(prefix: str, conn: sqlite3.Connection,
+                                   limit: int = 100) -> Dict[str, Tuple[str, str]]:
+    """
+    :return: dict of at most limit members whose phone starts with prefix, ordered by phone
+    """
+    return _search_members_by_prefix("PHONE", prefix, conn, limit)
+
+
+def _get_members_by_column(column: str, value: str, conn: sqlite3.Connection) -> Dict[str, Tuple[str, str]]:
+    """
+    :param column: str, has to be one of the trusted column names (it's formatted into query)
+    """
+    query = f"SELECT MEMBER_ID,EMAIL,PHONE FROM MEMBERS WHERE {column}=?"
+    return {member_id: (email, phone) for member_id, email, phone in conn.execute(query, (value,))}
+
+
+def _search_members_by_prefix(column: str, prefix: str, conn: sqlite3.Connection,
+                              limit: int) -> Dict[str, Tuple[str, str]]:
+    """
+    Prefix is searched with range (column >= prefix AND column < next prefix) instead of LIKE
+    because LIKE is case insensitive and can't use index with default (binary) collation.
+    :param column: str, has to be one of the trusted column names (it's formatted into query)
+    """
+    query = f"SELECT MEMBER_ID,EMAIL,PHONE FROM MEMBERS WHERE {column}>=?"
+    parameters = [prefix]
+    if prefix and prefix[-1] != chr(0x10FFFF):
+        # Smallest string bigger than all strings starting with prefix, "ABC" -> "ABD"
+        query += f" AND {column}<?"
+        parameters.append(prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    query += f" ORDER BY {column} LIMIT ?"
+    parameters.append(limit)
+
+    return {member_id: (email, phone) for member_id, email, phone in conn.execute(query, parameters)}
+
+
 def get_member_data_injection(member_id: str, conn: sqlite3.Connection) -> dict:
     """
     Gets email and phone data from database based on passed member.
@@ -74,18 +250,369 @@ def get_member_data_injection(member_id: str, conn: sqlite3.Connection) -> dict:
     return dict(rows)
 
 
-def print_db(conn):
+class MemberCacheStats(NamedTuple):
+    hits: int
+    misses: int
+    expired: int
+    evictions: int
+    invalidations: int
+    size: int
+    maxsize: int
+
+
+class MemberCache:
+    """
+    Thread safe read-through LRU cache in front of get_member_data, with optional TTL.
+    Pass the cache to write functions (add_members, add_random_member..) so they invalidate
+    written members.
+
+    Example:
+        cache = MemberCache(maxsize=10_000, ttl=60)
+        cache.get_member_data("1234", conn)
+        add_members(rows, conn, cache)
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: Optional[float] = None):
+        """
+        :param maxsize: int, max number of cached members
+        :param ttl: optional float, seconds after which cached member is loaded again
+        """
+        if maxsize < 1:
+            raise ValueError("Cache maxsize has to be at least 1.")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # member ID -> (member data, time when it was loaded)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # Increased on every invalidation so values loaded before it are not stored
+        self._generation = 0
+        self._hits = self._misses = self._expired = self._evictions = self._invalidations = 0
+
+    def get_member_data(self, member_id: str, conn: sqlite3.Connection) -> dict:
+        """Same as get_member_data but cached, missing members are cached too."""
+        with self._lock:
+            cached = self._cache.get(member_id)
+            if cached is not None:
+                member_data, loaded_at = cached
+                if self.ttl is None or time.monotonic() - loaded_at < self.ttl:
+                    self._hits += 1
+                    self._cache.move_to_end(member_id)
+                    return dict(member_data)
+                self._expired += 1
+                del self._cache[member_id]
+            self._misses += 1
+            generation = self._generation
+
+        # Loaded outside of lock so slow queries don't block other threads
+        member_data = get_member_data(member_id, conn)
+        with self._lock:
+            if generation == self._generation:
+                self._cache[member_id] = (member_data, time.monotonic())
+                if len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+                    self._evictions += 1
+        return dict(member_data)
+
+    def invalidate(self, member_ids: Iterable[str]):
+        with self._lock:
+            self._generation += 1
+            for member_id in member_ids:
+                if self._cache.pop(member_id, None) is not None:
+                    self._invalidations += 1
+
+    def stats(self) -> MemberCacheStats:
+        with self._lock:
+            return MemberCacheStats(self._hits, self._misses, self._expired, self._evictions,
+                                    self._invalidations, len(self._cache), self.maxsize)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+            self._hits = self._misses = self._expired = self._evictions = self._invalidations = 0
+
+
+class ConnectionPool:
+    """
+    Thread safe access to the database. Readers check out one of at most max_readers read
+    connections (created on first use) and return it when done, all writes go through one shared
+    writer connection.
+    Database file has to exist (see get_connection).
+
+    Example:
+        with ConnectionPool("db.sqlite3") as pool:
+            pool.get_member_data("1234")
+            await get_member_data_async("1234", pool)
+    """
+
+    def __init__(self, database_path: str, max_readers: int = 8, *, tuned: bool = True,
+                 cache: Optional[MemberCache] = None):
+        """
+        :param max_readers: int, max number of read connections (so threads reading at the same
+                            time), also size of executor used for async queries
+        :param tuned: bool, default True. See connect, WAL mode lets readers work during writes.
+        :param cache: optional MemberCache used for get_member_data and invalidated on writes
+        """
+        self.database_path = database_path
+        self.cache = cache
+        self.tuned = tuned
+        self.executor = ThreadPoolExecutor(max_readers, thread_name_prefix="members-reader")
+        # Idle read connections, None is a slot for a connection that wasn't opened yet.
+        # LIFO so the most recently used (warm cache) connection is reused first.
+        self._idle_readers = queue.LifoQueue(max_readers)
+        for _ in range(max_readers):
+            self._idle_readers.put(None)
+        self._reader_connections = []
+        self._reader_connections_lock = threading.Lock()
+        # Connection is only ever used by one thread at a time (guarded by lock)
+        self._writer = connect(database_path, tuned=tuned, check_same_thread=False)
+        self._writer_lock = threading.Lock()
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Checks out a read connection, blocks if all max_readers connections are in use."""
+        conn = self._idle_readers.get()
+        try:
+            if conn is None:
+                # Used from different threads over time so same thread check has to be off
+                conn = connect(self.database_path, tuned=self.tuned, check_same_thread=False)
+                with self._reader_connections_lock:
+                    self._reader_connections.append(conn)
+            yield conn
+        finally:
+            self._idle_readers.put(conn)
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """The only write connection, blocks until other writers are done."""
+        with self._writer_lock:
+            yield self._writer
+
+    def get_member_data(self, member_id: str) -> dict:
+        with self.reader() as conn:
+            if self.cache is not None:
+                return self.cache.get_member_data(member_id, conn)
+            return get_member_data(member_id, conn)
+
+    def get_members(self, member_ids: Iterable[str]) -> Dict[str, Tuple[str, str]]:
+        with self.reader() as conn:
+            return get_members(member_ids, conn)
+
+    def add_members(self, rows: Iterable[Tuple[str, str, str]]) -> int:
+        with self.writer() as conn:
+            return add_members(rows, conn, self.cache)
+
+    def close(self):
+        self.executor.shutdown()
+        with self._reader_connections_lock:
+            for conn in self._reader_connections:
+                conn.close()
+            self._reader_connections.clear()
+        with self._writer_lock:
+            self._writer.close()
+
+    def __enter__(self) -> "ConnectionPool":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+async def get_member_data_async(member_id: str, pool: ConnectionPool) -> dict:
+    """
+    Same as get_member_data but query runs on pool executor so it doesn't block the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool.executor, pool.get_member_data, member_id)
+
+
+async def get_members_async(member_ids: Iterable[str], pool: ConnectionPool) -> Dict[str, Tuple[str, str]]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool.executor, pool.get_members, list(member_ids))
+
+
+def iter_members(conn: sqlite3.Connection, *, batch_size: int = 1000,
+                 raw: bool = False) -> Generator[Union[dict, tuple], None, None]:
+    """
+    Streams whole MEMBERS table, only batch_size rows are in memory at once.
+    :param batch_size: int, number of rows fetched from cursor at once
+    :param raw: bool, default False. If True rows are yielded as they come from cursor (tuples
+                unless connection has row_factory set) without building a dict for every row.
+    :return: generator yielding dicts with column names as keys or raw rows
+    """
     query = "SELECT * FROM MEMBERS"
-    cursor = conn.cursor()
-    cursor.execute(query)
-    rows = cursor.fetchall()
+    cursor = conn.execute(query)
+    try:
+        columns = tuple(description[0] for description in cursor.description)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            if raw:
+                yield from rows
+            else:
+                for row in rows:
+                    yield dict(zip(columns, row))
+    finally:
+        cursor.close()
+
+
+def export_members(conn: sqlite3.Connection, out: Optional[TextIO] = None, output_format: str = "csv", *,
+                   batch_size: int = 1000, raw: bool = False) -> int:
+    """
+    Streams MEMBERS table to out with constant memory.
+    :param out: text file like object, default None is current sys.stdout (looked up on call so
+                redirect_stdout works). Files for csv should be opened with newline=""
+    :param output_format: str, "csv" (with header row) or "jsonl" (one JSON per line)
+    :param raw: bool, default False. Only affects jsonl, if True rows are written as JSON arrays
+                instead of objects so no dict is built per row. csv always writes rows as they are.
+    :return: int, number of exported rows
+    """
+    if output_format not in ("csv", "jsonl"):
+        raise ValueError(f"Unknown output format {output_format}")
+    if out is None:
+        out = sys.stdout
+
+    cursor = conn.execute("SELECT * FROM MEMBERS LIMIT 0")
+    columns = tuple(description[0] for description in cursor.description)
     cursor.close()
+
+    count = 0
+    if output_format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        for row in iter_members(conn, batch_size=batch_size, raw=True):
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in iter_members(conn, batch_size=batch_size, raw=raw):
+            out.write(json.dumps(tuple(row) if raw else row))
+            out.write("\n")
+            count += 1
+    return count
+
+
+def print_db(conn):
     print("Printing database table MEMBERS:")
-    for row in rows:
-        print("\t", dict(row))
+    for row in iter_members(conn):
+        print("\t", row)
     print()  # newline for pretty print
 
 
+def test_indexes_used() -> bool:
+    """
+    Checks with EXPLAIN QUERY PLAN that email/phone lookups use indexes instead of table scan.
+    Explained statements are the ones the public functions actually executed (captured with
+    trace callback, which passes SQL with bound values filled in).
+    """
+    conn = create_database(":memory:")
+    add_members([("1", "ABCDE", "12345678"), ("2", "ABCDF", "12345679"), ("3", "ABD", "2")], conn)
+
+    lookups = (
+        (lambda: get_members_by_email("ABCDE", conn), ["1"], "MEMBERS_EMAIL_INDEX"),
+        (lambda: get_members_by_phone("2", conn), ["3"], "MEMBERS_PHONE_INDEX"),
+        (lambda: search_members_by_email_prefix("ABC", conn), ["1", "2"], "MEMBERS_EMAIL_INDEX"),
+        (lambda: search_members_by_phone_prefix("1234567", conn, limit=1), ["1"], "MEMBERS_PHONE_INDEX"),
+    )
+    for lookup, expected_ids, index_name in lookups:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            result = lookup()
+        finally:
+            conn.set_trace_callback(None)
+        if list(result) != expected_ids or len(statements) != 1:
+            return False
+
+        plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + statements[0])]
+        # Anything else (SCAN MEMBERS, USE TEMP B-TREE FOR ORDER BY..) means index is not used
+        if len(plan) != 1 or not plan[0].startswith(f"SEARCH MEMBERS USING INDEX {index_name} "):
+            return False
+
+    conn.close()
+    return True
+
+
+def test_member_cache() -> bool:
+    """
+    Write through add_members drops a cached miss, expired member is loaded again and LRU
+    member is evicted first.
+    """
+    conn = create_database(":memory:")
+    add_members([("1", "ABCDE", "12345678")], conn)
+    cache = MemberCache(maxsize=2, ttl=60)
+
+    # Missing member is cached as {} until add_members invalidates it
+    if cache.get_member_data("2", conn) != {} or cache.get_member_data("2", conn) != {}:
+        return False
+    add_members([("2", "ABCDF", "12345679")], conn, cache)
+    if cache.get_member_data("2", conn) != {"ABCDF": "12345679"}:
+        return False
+
+    # Changed without cache so only expiry can pick it up, loaded_at is moved back past ttl
+    cache.get_member_data("1", conn)
+    with conn:
+        conn.execute("UPDATE MEMBERS SET EMAIL='EDCBA' WHERE MEMBER_ID='1'")
+    if cache.get_member_data("1", conn) != {"ABCDE": "12345678"}:
+        return False
+    member_data, loaded_at = cache._cache["1"]
+    cache._cache["1"] = (member_data, loaded_at - 61)
+    if cache.get_member_data("1", conn) != {"EDCBA": "12345678"}:
+        return False
+
+    # "2" is least recently used, so loading "3" evicts it and "1" stays cached
+    cache.get_member_data("3", conn)
+    if list(cache._cache) != ["1", "3"]:
+        return False
+    cache.get_member_data("1", conn)
+
+    return cache.stats() == MemberCacheStats(hits=3, misses=5, expired=1, evictions=1,
+                                             invalidations=1, size=2, maxsize=2)
+
+
+def test_connection_pool() -> bool:
+    """
+    Threads reading at the same time have to share at most max_readers read connections,
+    the rest block until a connection is returned.
+    """
+    import os
+    import tempfile
+
+    thread_count, max_readers = 20, 2
+    start_barrier = threading.Barrier(thread_count)
+    counter_lock = threading.Lock()
+    checked_out = max_checked_out = 0
+    results = []
+
+    def read(pool: ConnectionPool):
+        nonlocal checked_out, max_checked_out
+        start_barrier.wait()
+        with pool.reader() as conn:
+            with counter_lock:
+                checked_out += 1
+                max_checked_out = max(max_checked_out, checked_out)
+            time.sleep(0.01)  # hold connection so other threads have to wait for it
+            results.append(get_member_data("1", conn))
+            with counter_lock:
+                checked_out -= 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = os.path.join(directory, "pool.sqlite3")
+        create_database(database_path, tuned=True).close()
+        with ConnectionPool(database_path, max_readers=max_readers) as pool:
+            pool.add_members([("1", "ABCDE", "12345678")])
+            threads = [threading.Thread(target=read, args=(pool,)) for _ in range(thread_count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            open_readers = len(pool._reader_connections)
+
+    return (results == [{"ABCDE": "12345678"}] * thread_count
+            and max_checked_out == max_readers and open_readers == max_readers)
+
+
 if __name__ == "__main__":
     connection = get_connection("db.sqlite3")
     connection.row_factory = sqlite3.Row  # this  is for getting the column names when we fetch, for nice printing
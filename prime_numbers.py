@@ -1,4 +1,14 @@
-from typing import Generator
+import os
+from array import array
+from itertools import compress
+from math import gcd, isqrt, log, prod
+from multiprocessing import Pool
+from typing import Generator, Iterable, List, Optional, Tuple, Union
+
+
+# Amount of consecutive numbers sieved at once, memory usage is bounded by it
+# no matter how big the range is (plus the base primes up to sqrt of the range end).
+SEGMENT_SIZE = 2**18
 
 
 def get_mersenne_number(exponent: int) -> int:
@@ -10,25 +20,359 @@ def mersenne_generator(max_exponent: int) -> Generator[int, None, None]:
         yield get_mersenne_number(i)
 
 
+def lucas_lehmer(exponent: int) -> bool:
+    """
+    Lucas-Lehmer test, checks if 2^exponent - 1 is a prime.
+    Source: https://en.wikipedia.org/wiki/Lucas%E2%80%93Lehmer_primality_test
+    :param exponent: int, has to be a prime otherwise the result is meaningless
+                     (mersenne number with composite exponent is always composite)
+    :return: bool, is mersenne number with passed exponent a prime
+    """
+    if exponent == 2:
+        return True
+
+    mersenne = get_mersenne_number(exponent)
+    s = 4
+    for _ in range(exponent - 2):
+        s = s * s - 2
+        # Same as s % mersenne but cheaper since 2^exponent = 1 (mod mersenne), so bits above
+        # exponent can just be shifted down and added to the lower bits.
+        s = (s & mersenne) + (s >> exponent)
+        if s >= mersenne:
+            s -= mersenne
+    return s == 0
+
+
+def mersenne_prime_exponents(max_exponent: int) -> Generator[int, None, None]:
+    """
+    Only prime exponents are tested (sieved) and each is checked with Lucas-Lehmer test.
+    :param max_exponent: int, including
+    :return: generator yielding exponents p for which 2^p - 1 is a prime, as soon as confirmed
+    """
+    for exponent in primes_in_range(2, max_exponent + 1):
+        if lucas_lehmer(exponent):
+            yield exponent
+
+
+def mersenne_prime_generator(max_exponent: int) -> Generator[int, None, None]:
+    for exponent in mersenne_prime_exponents(max_exponent):
+        yield get_mersenne_number(exponent)
+
+
+# Primes used for cheap trial division before any of the heavier tests
+_SMALL_PRIMES = (3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59, 61, 67, 71, 73,
+                 79, 83, 89, 97)
+# One gcd with the product is faster than looping over all small primes
+_SMALL_PRIMES_PRODUCT = prod(_SMALL_PRIMES)
+# Below this it's faster to just do trial division up to sqrt
+_TRIAL_DIVISION_LIMIT = 2**14
+# Pairs of (limit, bases), testing against bases is deterministic for all n < limit
+# Source: https://oeis.org/A014233
+_MILLER_RABIN_BASES = (
+    (3_215_031_751, (2, 3, 5, 7)),
+    (341_550_071_728_321, (2, 3, 5, 7, 11, 13, 17)),
+    (2**64, (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)),
+)
+
+
 def is_prime(number: int) -> bool:
+    """
+    Dispatches to the fastest test depending on size of number:
+    trial division for small numbers, deterministic Miller-Rabin for numbers below 2^64 and
+    Baillie-PSW for anything bigger (no known counterexamples, but it's probabilistic).
+    """
+    if number < 2:
+        return False
+
     # Only odd numbers can be primes (except 2)
     if number & 1:
+        if number < 9:
+            return number != 1
 
-        # No prime number greater than 5 ends in a 5
-        if number > 5 and number % 5 == 0:
-            return False
+        if gcd(number, _SMALL_PRIMES_PRODUCT) != 1:
+            return number in _SMALL_PRIMES
+        elif number < _TRIAL_DIVISION_LIMIT:
+            return _trial_division(number)
 
-        # You can loop up to, including, the square root of the number
-        # Skip even numbers as odd%even will never be divisible without reminder
-        for i in range(3, int(number**0.5)+1, 2):
-            if number % i == 0:
-                return False
-        return True
+        for limit, bases in _MILLER_RABIN_BASES:
+            if number < limit:
+                for base in bases:
+                    if not _miller_rabin(number, base):
+                        return False
+                return True
+
+        return _miller_rabin(number, 2) and _strong_lucas_probable_prime(number)
     else:
         # The only even number which is a prime is 2
         return number == 2
 
 
+def _trial_division(number: int) -> bool:
+    """
+    :param number: odd int that is not divisible by any of _SMALL_PRIMES
+    """
+    # You can loop up to, including, the square root of the number
+    # Skip even numbers as odd%even will never be divisible without reminder
+    for i in range(101, isqrt(number) + 1, 2):
+        if number % i == 0:
+            return False
+    return True
+
+
+def _miller_rabin(number: int, base: int) -> bool:
+    """
+    Strong probable prime test to passed base.
+    :param number: odd int > 2
+    :return: False if number is composite, True if number is a strong probable prime to base.
+    """
+    base %= number
+    if base == 0:
+        return True
+
+    # number - 1 = d * 2^s where d is odd
+    d = number - 1
+    s = (d & -d).bit_length() - 1
+    d >>= s
+
+    x = pow(base, d, number)
+    if x == 1 or x == number - 1:
+        return True
+    for _ in range(s - 1):
+        x = x * x % number
+        if x == number - 1:
+            return True
+    return False
+
+
+def _jacobi(a: int, n: int) -> int:
+    """Jacobi symbol (a/n) for odd positive n."""
+    a %= n
+    result = 1
+    while a:
+        while not a & 1:
+            a >>= 1
+            if n & 7 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a & 3 == 3 and n & 3 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def _strong_lucas_probable_prime(number: int) -> bool:
+    """
+    Strong Lucas probable prime test with Selfridge's method A parameters.
+    Together with Miller-Rabin to base 2 it makes the Baillie-PSW test.
+    Source: https://en.wikipedia.org/wiki/Lucas_pseudoprime
+    :param number: odd int that is not a small prime
+    """
+    # Perfect squares would make the search for D below loop forever
+    if isqrt(number)**2 == number:
+        return False
+
+    # Find first D in sequence 5, -7, 9, -11, ... for which Jacobi symbol (D/n) is -1
+    d = 5
+    while True:
+        jacobi = _jacobi(d, number)
+        if jacobi == -1:
+            break
+        elif jacobi == 0 and abs(d) != number:
+            return False
+        d = -d - 2 if d > 0 else -d + 2
+    p, q = 1, (1 - d) // 4
+
+    # number + 1 = k * 2^s where k is odd
+    k = number + 1
+    s = (k & -k).bit_length() - 1
+    k >>= s
+
+    # Compute U_k, V_k and Q^k with binary method going from the most significant bit
+    u, v, q_k = 1, p, q % number
+    for bit in bin(k)[3:]:
+        u, v = u * v % number, (v * v - 2 * q_k) % number
+        q_k = q_k * q_k % number
+        if bit == "1":
+            u, v = p * u + v, d * u + p * v
+            # Division by 2 mod n, if value is odd add n to make it even
+            u = (u + number if u & 1 else u) // 2 % number
+            v = (v + number if v & 1 else v) // 2 % number
+            q_k = q_k * q % number
+
+    if u == 0 or v == 0:
+        return True
+    for _ in range(s - 1):
+        v = (v * v - 2 * q_k) % number
+        if v == 0:
+            return True
+        q_k = q_k * q_k % number
+    return False
+
+
+def _base_primes(limit: int) -> Tuple[int, ...]:
+    """
+    Simple (non segmented) sieve of Eratosthenes.
+    :param limit: int, including
+    :return: tuple of all primes <= limit
+    """
+    if limit < 2:
+        return ()
+
+    sieve = bytearray([1]) * (limit + 1)
+    sieve[0] = sieve[1] = 0
+    for i in range(2, isqrt(limit) + 1):
+        if sieve[i]:
+            sieve[i*i::i] = bytes(len(range(i*i, limit + 1, i)))
+    return tuple(i for i, flag in enumerate(sieve) if flag)
+
+
+def _sieve_segment(low: int, high: int, base_primes: Tuple[int, ...]) -> bytearray:
+    """
+    Sieves one segment [low, high).
+    :param base_primes: tuple of primes that has to contain all primes <= sqrt(high - 1)
+    :return: bytearray where index i is 1 if low + i is a prime, otherwise 0
+    """
+    size = high - low
+    segment = bytearray([1]) * size
+    for prime in base_primes:
+        square = prime * prime
+        if square >= high:
+            break
+        # First multiple of prime inside segment, everything below square was already
+        # crossed out by smaller primes.
+        start = max(square, (low + prime - 1) // prime * prime) - low
+        segment[start::prime] = bytes(len(range(start, size, prime)))
+
+    # 0 and 1 are not crossed out by any prime
+    for not_prime in range(low, min(high, 2)):
+        segment[not_prime - low] = 0
+    return segment
+
+
+def primes_in_range(lo: int, hi: int) -> Generator[int, None, None]:
+    """
+    Segmented sieve of Eratosthenes.
+    Memory usage stays bounded by SEGMENT_SIZE so it can be used for ranges in billions.
+    :param lo: int, start of range (including)
+    :param hi: int, end of range (excluding), same as builtin range
+    :return: generator yielding primes in range [lo, hi) in ascending order
+    """
+    lo = max(lo, 0)
+    if hi <= lo:
+        return
+
+    base_primes = _base_primes(isqrt(hi - 1))
+    for low in range(lo, hi, SEGMENT_SIZE):
+        high = min(low + SEGMENT_SIZE, hi)
+        segment = _sieve_segment(low, high, base_primes)
+        for index, flag in enumerate(segment):
+            if flag:
+                yield low + index
+
+
+def _segment_sieve_cost(low: int, high: int) -> int:
+    """
+    Rough cost of sieving segment [low, high) measured in is_prime calls, sieving is only worth
+    it when the segment contains more numbers to check than this.
+    Each is_prime call costs about as much as sieving 300 numbers or crossing off one base prime
+    (approximately sqrt(high) / ln(sqrt(high)) of them) 3 times.
+    """
+    sqrt_high = isqrt(high) + 2
+    return (high - low) // 300 + int(sqrt_high / log(sqrt_high)) // 3
+
+
+def is_prime_many(numbers: Iterable[int]) -> List[bool]:
+    """
+    Batch version of is_prime.
+    Only segments dense enough in passed numbers are sieved, numbers in sparse segments and
+    numbers >= SEGMENT_SIZE^2 (their base primes would be too expensive to sieve) are checked
+    with is_prime, so sparse batches with huge numbers stay cheap.
+    :param numbers: iterable of ints
+    :return: list of bools, in the same order as passed numbers
+    """
+    numbers = list(numbers)
+    results = [False] * len(numbers)
+
+    # Segment start -> list of indexes in numbers that fall into that segment
+    segments = {}
+    for index, number in enumerate(numbers):
+        if number >= SEGMENT_SIZE**2:
+            results[index] = is_prime(number)
+        elif number >= 2:
+            segments.setdefault(number - number % SEGMENT_SIZE, []).append(index)
+
+    dense_segments = []
+    for low, indexes in segments.items():
+        high = low + max(numbers[index] for index in indexes) % SEGMENT_SIZE + 1
+        if len(indexes) > _segment_sieve_cost(low, high):
+            dense_segments.append((low, high, indexes))
+        else:
+            for index in indexes:
+                results[index] = is_prime(numbers[index])
+
+    if not dense_segments:
+        return results
+
+    base_primes = _base_primes(isqrt(max(high for _, high, _ in dense_segments) - 1))
+    for low, high, indexes in dense_segments:
+        segment = _sieve_segment(low, high, base_primes)
+        for index in indexes:
+            results[index] = bool(segment[numbers[index] - low])
+
+    return results
+
+
+def _init_worker_base_primes(base_primes: Tuple[int, ...]):
+    global _worker_base_primes
+    _worker_base_primes = base_primes
+
+
+def _sieve_chunk(bounds: Tuple[int, int, bool]) -> Union[array, int]:
+    """
+    Process pool worker, sieves chunk [low, high) segment by segment.
+    Results are sent back as packed array of primes (or just their count) so pickling is cheap
+    compared to sending back a result for every number.
+    """
+    low, high, count_only = bounds
+    primes = 0 if count_only else array("Q")
+    for segment_low in range(low, high, SEGMENT_SIZE):
+        segment_high = min(segment_low + SEGMENT_SIZE, high)
+        segment = _sieve_segment(segment_low, segment_high, _worker_base_primes)
+        if count_only:
+            primes += segment.count(1)
+        else:
+            primes.extend(compress(range(segment_low, segment_high), segment))
+    return primes
+
+
+def parallel_primes(lo: int, hi: int, workers: Optional[int] = None, *,
+                    count_only: bool = False,
+                    chunk_size: int = SEGMENT_SIZE * 16) -> Union[array, int]:
+    """
+    Shards range [lo, hi) into chunks and sieves them in a process pool.
+    :param lo: int, start of range (including)
+    :param hi: int, end of range (excluding), has to be below 2^64
+    :param workers: optional int, number of processes, None (default) lets Pool use number of cores
+    :param count_only: bool, default False. If True only the number of primes is returned.
+    :param chunk_size: int, amount of numbers sent to worker at once
+    :return: array('Q') of primes in range [lo, hi) in ascending order or int if count_only
+    """
+    lo = max(lo, 0)
+    chunks = ((low, min(low + chunk_size, hi), count_only) for low in range(lo, hi, chunk_size))
+    base_primes = _base_primes(isqrt(hi - 1)) if hi > lo else ()
+
+    with Pool(workers, initializer=_init_worker_base_primes, initargs=(base_primes,)) as pool:
+        # imap keeps the order of chunks
+        results = pool.imap(_sieve_chunk, chunks)
+        if count_only:
+            return sum(results)
+
+        primes = array("Q")
+        for chunk_primes in results:
+            primes.extend(chunk_primes)
+        return primes
+
+
 def test_is_prime() -> bool:
     with open("primes.txt") as f:
         primes = tuple(int(x) for x in f.read().split(","))
@@ -42,13 +386,70 @@ def test_is_prime() -> bool:
         if is_prime(not_prime):
             return False
 
+    # Negative numbers, 0 and 1 aren't primes, including negated primes
+    for number in (-1, -2, -3, -9, -101, -(2**61 - 1), -(2**89 - 1), 0, 1):
+        if is_prime(number):
+            return False
+
+    # Sieve has to agree with primes.txt, also check segment borders by using range that
+    # doesn't start at 0 and isn't aligned to segment size.
+    if tuple(primes_in_range(0, primes[-1] + 1)) != primes:
+        return False
+    elif tuple(primes_in_range(primes[10], primes[-1] + 1)) != primes[10:]:
+        return False
+
+    all_numbers = range(-5, primes[-1] + 1)
+    if is_prime_many(all_numbers) != [number in primes for number in all_numbers]:
+        return False
+    # Sparse and huge numbers go through is_prime, dense ones are sieved
+    mixed_numbers = [10**16 + 61, 2**61 - 1, 2**89 - 1, -7, 999_983, 10**10 + 19]
+    mixed_numbers.extend(range(10**9, 10**9 + 20_000))
+    if is_prime_many(mixed_numbers) != [is_prime(number) for number in mixed_numbers]:
+        return False
+
+    if tuple(parallel_primes(0, primes[-1] + 1, 2, chunk_size=1000)) != primes:
+        return False
+    elif parallel_primes(0, primes[-1] + 1, 2, count_only=True, chunk_size=1000) != len(primes):
+        return False
+
     return True
 
 
 if __name__ == "__main__":
     import cProfile
     # Around 2.12s for checking first 1m numbers (x64 CPython3.8 i5-4590S)
+    # Around 0.8s with gcd against small primes + Miller-Rabin dispatch
     cProfile.run("""for number in range(1_000_000): is_prime(number)""")
+    # Around 0.07s to get all primes in first 1m numbers with segmented sieve
+    cProfile.run("""for number in primes_in_range(0, 1_000_000): pass""")
+    # Around 0.5s to check first 1m numbers in batch (most of it is grouping by segment)
+    cProfile.run("""is_prime_many(range(1_000_000))""")
     # Around 0.015s to check first n mersenne numbers in range of max exponent of 60
     # (59 numbers generated last one is 1152921504606846975)
+    # Around 0.0005s with Miller-Rabin
     cProfile.run("""for number in mersenne_generator(60): is_prime(number)""")
+    # Around 6s with Baillie-PSW for exponents above 64, up to exponent 2300
+    cProfile.run("""for number in mersenne_generator(2300): is_prime(number)""")
+    # Around 0.85s with Lucas-Lehmer on prime exponents only, up to exponent 2300
+    cProfile.run("""for number in mersenne_prime_generator(2300): pass""")
+
+    # Scaling of parallel sieve across worker counts, first 1b numbers (count only)
+    # Around 12s with 1 worker, should scale close to linearly with number of cores
+    from time import perf_counter
+    for worker_count in (1, 2, 4, 8, 16, 32):
+        if worker_count > os.cpu_count():
+            break
+        start = perf_counter()
+        prime_count = parallel_primes(0, 1_000_000_000, worker_count, count_only=True)
+        print(f"{worker_count} workers: {prime_count} primes in {perf_counter() - start:.2f}s")
+
+    # How far can Lucas-Lehmer get in a fixed time budget, mersenne primes are printed as found.
+    # Around exponent 7000 tested in 60s (last mersenne prime found 2^4423 - 1)
+    time_budget = 60
+    start = perf_counter()
+    for tested_exponent in primes_in_range(2, 1_000_000):
+        if lucas_lehmer(tested_exponent):
+            print(f"2^{tested_exponent} - 1 is a prime (found after {perf_counter() - start:.2f}s)")
+        if perf_counter() - start > time_budget:
+            print(f"Tested all prime exponents up to {tested_exponent} in {time_budget}s")
+            break
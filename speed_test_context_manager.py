@@ -1,15 +1,395 @@
-from time import process_time
+import functools
+import random
+import threading
+import weakref
+from time import perf_counter, perf_counter_ns, process_time
 from contextlib import contextmanager
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class TimerResult:
+    """Filled in when the timed block exits, times are in seconds."""
+    __slots__ = ("wall", "cpu")
+
+    def __init__(self):
+        self.wall = self.cpu = None
 
 
 @contextmanager
 def timer():
-    start = process_time()
+    """
+    Single shot timing of a block, prints wall and CPU time on exit.
+    Yields TimerResult so the caller can use the measured times, with timer() as timing: ...
+    For statistically meaningful numbers use benchmark.benchmark, for always-on instrumentation
+    use Profiler spans.
+    """
+    timing = TimerResult()
+    cpu_start = process_time()
+    wall_start = perf_counter()
     try:
-        yield
+        yield timing
     finally:
-        end = process_time()
-        print(f"Task finished in {end - start} seconds.")
+        timing.wall = perf_counter() - wall_start
+        timing.cpu = process_time() - cpu_start
+        print(f"Task finished in {timing.wall} seconds ({timing.cpu} seconds CPU).")
+
+
+class SpanStats(NamedTuple):
+    """Times are in nanoseconds, self_ns excludes time spent in child spans."""
+    name: str
+    count: int
+    total_ns: int
+    self_ns: int
+    min_ns: int
+    max_ns: int
+    # bucket -> count, bucket b holds durations in [2^(b-1), 2^b) ns
+    histogram: Dict[int, int]
+
+    def percentile(self, percent: float) -> int:
+        """
+        :return: int, upper bound (ns) of histogram bucket containing the percentile
+        """
+        remaining = self.count * percent / 100
+        for bucket in sorted(self.histogram):
+            remaining -= self.histogram[bucket]
+            if remaining <= 0:
+                return min(1 << bucket, self.max_ns)
+        return self.max_ns
+
+
+class _NullSpan:
+    """Returned while profiling is disabled or the current root span wasn't sampled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _ThreadState:
+    """Per thread stack and aggregates, so recording a span never takes a lock."""
+    __slots__ = ("stack", "spans", "stacks", "counters", "suppressed")
+
+    def __init__(self):
+        self.stack: List["_Span"] = []
+        # name -> [count, total_ns, self_ns, min_ns, max_ns, histogram]
+        self.spans: Dict[str, list] = {}
+        # tuple of span names from root -> self_ns
+        self.stacks: Dict[Tuple[str, ...], int] = {}
+        self.counters: Dict[str, int] = {}
+        self.suppressed = False
+
+    def merge(self, other: "_ThreadState"):
+        """Adds aggregates of other state to this one, other isn't changed."""
+        for name, (count, total, self_ns, min_ns, max_ns, histogram) in dict(other.spans).items():
+            aggregate = self.spans.get(name)
+            if aggregate is None:
+                self.spans[name] = [count, total, self_ns, min_ns, max_ns, dict(histogram)]
+                continue
+            aggregate[0] += count
+            aggregate[1] += total
+            aggregate[2] += self_ns
+            aggregate[3] = min(aggregate[3], min_ns)
+            aggregate[4] = max(aggregate[4], max_ns)
+            for bucket, bucket_count in dict(histogram).items():
+                aggregate[5][bucket] = aggregate[5].get(bucket, 0) + bucket_count
+        for path, self_ns in dict(other.stacks).items():
+            self.stacks[path] = self.stacks.get(path, 0) + self_ns
+        for name, value in dict(other.counters).items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+class _ThreadExit:
+    """Kept only in thread local storage, so it's collected (and finalizer called) when thread exits."""
+    __slots__ = ("__weakref__",)
+
+
+class _SuppressedRoot:
+    """Root span which wasn't sampled, spans nested in it are skipped too."""
+    __slots__ = ("state",)
+
+    def __init__(self, state: _ThreadState):
+        self.state = state
+
+    def __enter__(self):
+        self.state.suppressed = True
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.state.suppressed = False
+        return False
+
+
+class _Span:
+    __slots__ = ("state", "name", "path", "start", "child_ns")
+
+    def __init__(self, state: _ThreadState, name: str):
+        self.state = state
+        self.name = name
+
+    def __enter__(self):
+        stack = self.state.stack
+        self.path = stack[-1].path + (self.name,) if stack else (self.name,)
+        stack.append(self)
+        self.child_ns = 0
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        elapsed = perf_counter_ns() - self.start
+        state = self.state
+        stack = state.stack
+        stack.pop()
+        if stack:
+            stack[-1].child_ns += elapsed
+        self_ns = elapsed - self.child_ns
+
+        aggregate = state.spans.get(self.name)
+        if aggregate is None:
+            state.spans[self.name] = [1, elapsed, self_ns, elapsed, elapsed, {elapsed.bit_length(): 1}]
+        else:
+            aggregate[0] += 1
+            aggregate[1] += elapsed
+            aggregate[2] += self_ns
+            if elapsed < aggregate[3]:
+                aggregate[3] = elapsed
+            elif elapsed > aggregate[4]:
+                aggregate[4] = elapsed
+            histogram = aggregate[5]
+            bucket = elapsed.bit_length()
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+        state.stacks[self.path] = state.stacks.get(self.path, 0) + self_ns
+        return False
+
+
+class Profiler:
+    """
+    Hierarchical span profiler with in memory per name aggregates, cheap enough to leave on.
+
+    Sampling is decided per root span, a sampled root records all spans nested in it, so stacks
+    are always complete. Counters are exact, they aren't sampled.
+    While disabled span() returns a shared no-op context manager and profiled functions are
+    called directly.
+
+    Example:
+        profiler = Profiler(sample_rate=0.01)
+        with profiler.span("request"):
+            with profiler.span("parse"):
+                ...
+        print(profiler.summary())
+        profiler.write_collapsed("stacks.txt")  # flamegraph.pl stacks.txt > flame.svg
+    """
+
+    def __init__(self, sample_rate: float = 1.0, enabled: bool = True):
+        """
+        :param sample_rate: float in (0, 1], fraction of root spans which are recorded
+        :param enabled: bool, disabled profiler records nothing
+        """
+        if not 0 < sample_rate <= 1:
+            raise ValueError("Sample rate has to be in range (0, 1].")
+
+        self.sample_rate = sample_rate
+        self.enabled = enabled
+        self._local = threading.local()
+        # Aggregates of exited threads are folded into first state, so list doesn't grow with
+        # number of threads ever used, only with number of live ones
+        self._states: List[_ThreadState] = [_ThreadState()]
+        self._states_lock = threading.Lock()
+        self._random = random.random
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def _state(self) -> _ThreadState:
+        try:
+            return self._local.state
+        except AttributeError:
+            state = self._local.state = _ThreadState()
+            with self._states_lock:
+                self._states.append(state)
+            thread_exit = self._local.thread_exit = _ThreadExit()
+            # Weak reference so finalizer of long lived thread (main) doesn't keep profiler alive
+            weakref.finalize(thread_exit, Profiler._retire, weakref.ref(self), state).atexit = False
+            return state
+
+    @staticmethod
+    def _retire(profiler_ref: "weakref.ref[Profiler]", state: _ThreadState):
+        """Folds state of exited thread into exited threads' state."""
+        profiler = profiler_ref()
+        if profiler is not None:
+            with profiler._states_lock:
+                profiler._states.remove(state)
+                profiler._states[0].merge(state)
+
+    def span(self, name: str):
+        """
+        :return: context manager timing the block as span name, nested in currently open span
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+
+        state = self._state()
+        if state.suppressed:
+            return _NULL_SPAN
+        elif not state.stack and self.sample_rate < 1 and self._random() >= self.sample_rate:
+            return _SuppressedRoot(state)
+        return _Span(state, name)
+
+    def profiled(self, name: Optional[str] = None) -> Callable:
+        """
+        Decorator recording every call of function as span name (defaults to func.__qualname__).
+        """
+        def decorator(func: Callable) -> Callable:
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name: str, value: int = 1):
+        if self.enabled:
+            counters = self._state().counters
+            counters[name] = counters.get(name, 0) + value
+
+    def _snapshot_states(self) -> List[_ThreadState]:
+        with self._states_lock:
+            return list(self._states)
+
+    def _merged(self) -> _ThreadState:
+        merged = _ThreadState()
+        for state in self._snapshot_states():
+            merged.merge(state)
+        return merged
+
+    def stats(self) -> Dict[str, SpanStats]:
+        """
+        :return: dict of span name to SpanStats merged over all threads
+        """
+        return {name: SpanStats(name, *aggregate) for name, aggregate in self._merged().spans.items()}
+
+    def counters(self) -> Dict[str, int]:
+        return self._merged().counters
+
+    def collapsed_stacks(self) -> List[str]:
+        """
+        :return: list of "root;child;leaf self_ns" lines, the collapsed stack format read by
+                 flamegraph.pl, speedscope and similar tools
+        """
+        stacks = self._merged().stacks
+        return [f"{';'.join(path)} {self_ns}" for path, self_ns in sorted(stacks.items())]
+
+    def write_collapsed(self, path: str):
+        with open(path, "w") as f:
+            f.writelines(line + "\n" for line in self.collapsed_stacks())
+
+    def summary(self) -> str:
+        """
+        :return: table of spans sorted by total time (times in microseconds, p50/p99 are
+                 histogram bucket upper bounds) followed by counters
+        """
+        lines = [f"{'span':<32}{'count':>10}{'total':>14}{'self':>14}{'mean':>10}"
+                 f"{'min':>10}{'p50':>10}{'p99':>10}{'max':>10}"]
+        for stats in sorted(self.stats().values(), key=lambda stats: stats.total_ns, reverse=True):
+            lines.append(
+                f"{stats.name:<32}{stats.count:>10}{stats.total_ns / 1000:>14.1f}"
+                f"{stats.self_ns / 1000:>14.1f}{stats.total_ns / stats.count / 1000:>10.2f}"
+                f"{stats.min_ns / 1000:>10.2f}{stats.percentile(50) / 1000:>10.2f}"
+                f"{stats.percentile(99) / 1000:>10.2f}{stats.max_ns / 1000:>10.2f}"
+            )
+        if self.sample_rate < 1:
+            lines.append(f"(spans sampled at rate {self.sample_rate})")
+
+        counters = self.counters()
+        if counters:
+            lines.append("")
+            lines.append(f"{'counter':<32}{'value':>10}")
+            lines.extend(f"{name:<32}{value:>10}" for name, value in sorted(counters.items()))
+        return "\n".join(lines)
+
+    def reset(self):
+        """Clears recorded data, spans open while resetting are recorded to the cleared state."""
+        for state in self._snapshot_states():
+            state.spans = {}
+            state.stacks = {}
+            state.counters = {}
+
+
+# Shared profiler for instrumenting code across modules, disabled until profiler.enable()
+profiler = Profiler(enabled=False)
+
+
+def test_profiler() -> bool:
+    test = Profiler()
+
+    @test.profiled("leaf")
+    def leaf():
+        return 1
+
+    with test.span("root"):
+        with test.span("child"):
+            results = [leaf() for _ in range(3)]
+        leaf()
+    test.count("rows", 5)
+    test.count("rows")
+
+    stats = test.stats()
+    if results != [1, 1, 1] or stats["leaf"].count != 4 or stats["root"].count != 1:
+        return False
+    if not stats["root"].total_ns >= stats["child"].total_ns >= stats["child"].self_ns:
+        return False
+    if sum(stats[name].self_ns for name in ("root", "child", "leaf")) != stats["root"].total_ns:
+        return False
+    paths = [line.rsplit(" ", 1)[0] for line in test.collapsed_stacks()]
+    if paths != ["root", "root;child", "root;child;leaf", "root;leaf"]:
+        return False
+    if test.counters() != {"rows": 6}:
+        return False
+
+    test.disable()
+    with test.span("root"):
+        leaf()
+    test.count("rows")
+    if test.stats()["root"].count != 1 or test.counters() != {"rows": 6}:
+        return False
+
+    sampled = Profiler(sample_rate=0.5)
+    sampled._random = iter([0.9, 0.1]).__next__
+    for _ in range(2):
+        with sampled.span("root"):
+            with sampled.span("child"):
+                pass
+    sampled_stats = sampled.stats()
+    if sampled_stats["root"].count != 1 or sampled_stats["child"].count != 1:
+        return False
+
+    # Thread per request, states of exited threads are folded so only live ones are kept
+    threaded = Profiler()
+
+    def request():
+        with threaded.span("request"):
+            threaded.count("requests")
+
+    for _ in range(50):
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+    request()  # main thread state stays, it's still alive
+    return (len(threaded._states) == 2 and threaded.stats()["request"].count == 51
+            and threaded.counters() == {"requests": 51}
+            and threaded.collapsed_stacks()[0].startswith("request "))
 
 
 def example():
@@ -18,5 +398,42 @@ def example():
 
 
 if __name__ == "__main__":
+    from benchmark import benchmark
+
     with timer():
         example()
+
+    def bare():
+        pass
+
+    spanned = profiler.profiled("bare")(bare)
+
+    def with_span():
+        with profiler.span("bare"):
+            pass
+
+    # Around 0.085us bare call, disabled 0.18us decorated / 0.3us span,
+    # enabled 1.7us decorated / 1.4us span (sample rate 1), 0.7us span (sample rate 0.01)
+    print(benchmark(bare))
+    print(benchmark(spanned, name="disabled profiled"))
+    print(benchmark(with_span, name="disabled span"))
+    profiler.enable()
+    print(benchmark(spanned, name="enabled profiled"))
+    print(benchmark(with_span, name="enabled span"))
+    profiler.sample_rate = 0.01
+    print(benchmark(with_span, name="enabled span, sample rate 0.01"))
+    profiler.sample_rate = 1.0
+    profiler.reset()
+
+    from prime_numbers import is_prime
+    from qualifier_code_jam_6_python_discord import parse_iso8601
+    profiled_is_prime = profiler.profiled("is_prime")(is_prime)
+    profiled_parse = profiler.profiled("parse_iso8601")(parse_iso8601)
+    with profiler.span("main"):
+        with profiler.span("primes"):
+            profiler.count("primes found", sum(profiled_is_prime(n) for n in range(100_000)))
+        with profiler.span("timestamps"):
+            for second in range(60):
+                profiled_parse(f"2020-07-25T12:34:{second:02}.123+02:00")
+    print(profiler.summary())
+    print("\n".join(profiler.collapsed_stacks()))
@@ -1,12 +1,22 @@
-from time import process_time
+import functools
+from time import perf_counter, process_time
 
 
 def speed_test(func):
+    """
+    Single shot timing, prints wall and CPU time of every call and returns func's return value.
+    For statistically meaningful numbers use benchmark.benchmark / benchmark.benchmarked.
+    """
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start = process_time()
-        func(*args, **kwargs)
-        end = process_time()
-        print(f"{func.__name__} took {end - start} seconds.")
+        cpu_start = process_time()
+        wall_start = perf_counter()
+        result = func(*args, **kwargs)
+        wall_end = perf_counter()
+        cpu_end = process_time()
+        print(f"{func.__name__} took {wall_end - wall_start} seconds "
+              f"({cpu_end - cpu_start} seconds CPU).")
+        return result
     return wrapper
 
 
@@ -17,4 +27,8 @@ def example():
 
 
 if __name__ == "__main__":
+    from benchmark import benchmark
+
     example()
+    # Unwrapped function so the harness doesn't time the printing
+    print(benchmark(example.__wrapped__, repeat=5))